@@ -15,7 +15,6 @@
 """
 
 import sys
-import io
 
 SETUP_INFO = {'url': 'https://github.com/lino-framework/rstgen'}
 
@@ -42,37 +41,43 @@ def get_config_var(k):
     return _config[k]
 
 
+def __getattr__(name):
+    # PEP 562: expose the config vars also as module attributes
+    # (e.g. ``rstgen.use_dirhtml``), which is cheaper to read than a
+    # get_config_var() call in a build loop.
+    try:
+        return _config[name]
+    except KeyError:
+        raise AttributeError(name)
+
+
 class Column(object):
-    # A column in a Table.
+    # A thin public descriptor of one column in a Table.  The widths
+    # themselves live in a plain list on the Table (`Table._widths`) so
+    # that the hot scanning and padding loops index a list instead of
+    # chasing per-column attributes.
 
-    def __init__(self, table, index, header, width=None):
+    def __init__(self, table, index, header):
         self.table = table
         self.header = header
-        self.width = width
         self.index = index
 
+    @property
+    def width(self):
+        return self.table._widths[self.index] or None
+
     def __str__(self):
         return "{}[{}]:{}".format(self.table, self.index, self.header)
 
-    def adjust_width(self, row):
-        # Adjust required width of this column for the given row.
-        s = self.table.format_value(row[self.index])
-        s = str(s)
-        for ln in s.splitlines():
-            if self.width is None or self.width < len(ln):
-                self.width = len(ln)
-                # if self.width > 500:
-                #     raise Exception("width %r more than 500" % s)
-
 
 def header(level, text):
-    result = io.StringIO()
+    parts = []
 
     def writeln(s=''):
-        result.write(s + '\n')
+        parts.append(s + '\n')
 
     _write_header(writeln, level, text)
-    return result.getvalue()
+    return ''.join(parts)
 
 
 def write_header(fd, level, text):
@@ -84,31 +89,27 @@ def write_header(fd, level, text):
     _write_header(writeln, level, text)
 
 
+# Underline characters per header level.  Levels 1-3 also get an
+# overline.
+HEADER_CHARS = ('=', '-', '~', '=', '-', '~')
+
+
 def _write_header(writeln, level, s):
-    if level == 1:
-        writeln('=' * len(s))
-    elif level == 2:
-        writeln('-' * len(s))
-    elif level == 3:
-        writeln('~' * len(s))
-    writeln(s)
-    if level == 1:
-        writeln('=' * len(s))
-    elif level == 2:
-        writeln('-' * len(s))
-    elif level == 3:
-        writeln('~' * len(s))
-    elif level == 4:
-        writeln('=' * len(s))
-    elif level == 5:
-        writeln('-' * len(s))
-    elif level == 6:
-        writeln('~' * len(s))
-    else:
+    if level < 1 or level > len(HEADER_CHARS):
         raise Exception("Invalid level %d" % level)
+    rule = HEADER_CHARS[level - 1] * len(s)
+    if level <= 3:
+        writeln(rule)
+    writeln(s)
+    writeln(rule)
     writeln()
 
 
+# Preallocated run of blanks used for padding cells by slicing.  Grown
+# on demand by Table._write_to_list.
+_SPACES = ' ' * 256
+
+
 class Table(object):
     simple = True
 
@@ -116,79 +117,136 @@ class Table(object):
         return str(v)
 
     def __init__(self, headers, show_headers=True):
-        self.headers = [self.format_value(h) for h in headers]
+        # Bound once per instance.  Subclasses with expensive formatting
+        # (locale, decimal, ...) may replace `_fmt` by a closure over a
+        # preconstructed formatter instead of overriding format_value.
+        self._fmt = self.format_value
+        self.headers = [self._fmt(h) for h in headers]
         self.show_headers = show_headers
         self.cols = [Column(self, i, h) for i, h in enumerate(headers)]
-        self.adjust_widths(headers)
-
-    def adjust_widths(self, row):
+        self._widths = [0] * len(headers)
+        self._header_cells = [self._make_cell(h) for h in self.headers]
+        self._scan_row(self._header_cells)
+
+    @staticmethod
+    def _make_cell(s):
+        # A cell is carried internally as a (text, lines) tuple so that
+        # splitlines() runs only once per cell.
+        return (s, s.splitlines() or [''])
+
+    def _scan_row(self, row):
+        # One pass over the cells of `row` ((text, lines) tuples):
+        # update the required column widths and the `simple` flag.
         if len(row) != len(self.headers):
             raise Exception("Invalid row %(row)s" % dict(row=row))
-        for col in self.cols:
-            col.adjust_width(row)
-            if '\n' in row[col.index]:
+        widths = self._widths
+        for i, (s, lns) in enumerate(row):
+            if '\n' in s:
                 self.simple = False
+                w = max(map(len, lns))
+            else:
+                w = len(s)
+            if w > widths[i]:
+                widths[i] = w
 
     def format_row(self, row):
+        cells = [self._make_cell(s) for s in row]
+        if self.simple:
+            return self._format_row_simple(cells)
+        return self._format_row_multiline(cells)
+
+    def _format_row_simple(self, row):
+        # Fast path: every cell is a single line, so no splitting and
+        # no height equalization are needed.
+        return self._row_tpl.format(
+            *[s + _SPACES[:w - len(s)] if len(s) < w else s
+              for (s, lns), w in zip(row, self._widths)])
+
+    def _format_row_multiline(self, row):
         # ~ return ' '.join([unicode(row[c.index]).ljust(c.width) for c in self.cols])
-        lines = [[] for x in self.cols]
-        for c in self.cols:
-            cell = row[c.index]
-            for ln in cell.splitlines():
-                lines[c.index].append(ln.ljust(c.width))
-        height = 1
-        for c in self.cols:
-            height = max(height, len(lines[c.index]))
-        for c in self.cols:
-            while len(lines[c.index]) < height:
-                lines[c.index].append(''.ljust(c.width))
+        widths = self._widths
+        empties = [_SPACES[:w] for w in widths]
+        cell_lines = [cell[1] for cell in row]
+        height = max(map(len, cell_lines))
+        lines = []
+        for w, lns in zip(widths, cell_lines):
+            lines.append([
+                ln + _SPACES[:w - len(ln)] if len(ln) < w else ln
+                for ln in lns])
+        for i, lns in enumerate(lines):
+            d = height - len(lns)
+            if d:
+                lns.extend([empties[i]] * d)
+        tpl = self._row_tpl
         x = []
         for i in range(height):
-            x.append(self.margin
-                     +
-                     self.colsep.join(
-                         [' ' + lines[c.index][i] + ' ' for c in self.cols])
-                     + self.margin)
+            x.append(tpl.format(*[lns[i] for lns in lines]))
         return '\n'.join(x)
 
     def write(self, fd, data=[]):
         # ~ if len(data) == 0:
         # ~ raise Exception("No rows in %r" % data)
+        lines = []
+        self._write_to_list(lines, data)
+        fd.write('\n'.join(lines) + '\n')
+
+    def _write_to_list(self, lines, data=[]):
+        # Render the table as one string per output line, appended to
+        # the given list.  Used by both write() and to_rst().
+        fmt = self._fmt
+        make_cell = self._make_cell
+        len_cols = len(self.cols)
         rows = []
-        for i, row in enumerate(data):
-            assert len(row) == len(self.cols)
-            rows.append([self.format_value(v) for v in row])
+        for row in data:
+            assert len(row) == len_cols
+            rows.append([make_cell(fmt(v)) for v in row])
 
         for row in rows:
-            self.adjust_widths(row)
+            self._scan_row(row)
+
+        widths = self._widths
+        for i, w in enumerate(widths):
+            if w == 0:
+                widths[i] = 1
 
-        for c in self.cols:
-            if c.width is None:
-                c.width = 1
-                # raise Exception("width {} is None".format(c))
+        global _SPACES
+        if max(widths, default=0) > len(_SPACES):
+            _SPACES = ' ' * max(widths)
 
+        # Padded width (cell content plus the two surrounding blanks),
+        # computed once and reused for every rule line.
+        self._pw = [w + 2 for w in widths]
         if self.simple:
-            self.header1 = ' '.join([('=' * (c.width + 2)) for c in self.cols])
-            self.header2 = ' '.join([('-' * (c.width + 2)) for c in self.cols])
+            self.header1 = ' '.join([('=' * pw) for pw in self._pw])
+            self.header2 = ' '.join([('-' * pw) for pw in self._pw])
             self.margin = ''
             self.colsep = ' '
         else:
             self.header1 = '+' + \
-                           '+'.join([('-' * (c.width + 2)) for c in self.cols]) + '+'
+                           '+'.join([('-' * pw) for pw in self._pw]) + '+'
             self.header2 = '+' + \
-                           '+'.join([('=' * (c.width + 2)) for c in self.cols]) + '+'
+                           '+'.join([('=' * pw) for pw in self._pw]) + '+'
             self.margin = '|'
             self.colsep = '|'
 
+        # One row-format template per write(): the margins, separators
+        # and padding blanks are baked in, each row only fills in its
+        # (already padded) cells.
+        self._row_tpl = self.margin + \
+            self.colsep.join([' {} '] * len_cols) + self.margin
+
         def writeln(s):
-            fd.write(s.rstrip() + '\n')
+            lines.append(s.rstrip())
+
+        format_row = self._format_row_simple if self.simple \
+            else self._format_row_multiline
 
         writeln(self.header1)
         if self.show_headers:
-            writeln(self.format_row(self.headers))
+            writeln(format_row(self._header_cells))
             writeln(self.header2)
         for row in rows:
-            writeln(self.format_row(row))
+            writeln(format_row(row))
             if not self.simple:
                 writeln(self.header1)
         if self.simple:
@@ -197,9 +255,9 @@ class Table(object):
     def to_rst(self, rows):
         if len(rows) == 0:
             return "\n"
-        fd = io.StringIO()
-        self.write(fd, rows)
-        return fd.getvalue()
+        lines = []
+        self._write_to_list(lines, rows)
+        return '\n'.join(lines) + '\n'
 
 
 def table(headers, rows=tuple(), **kw):
@@ -208,23 +266,14 @@ def table(headers, rows=tuple(), **kw):
 
 
 def ul(items, bullet="-"):
-    s = ""
-    compressed = True
-    for i in items:
-        if '\n\n' in i:
-            compressed = False
-            break
-
+    # Materialize once so that a generator argument survives both the
+    # compressed check and the output pass.
+    items = list(items)
+    compressed = not any('\n\n' in i for i in items)
     innersep = '\n' + (' ' * (len(bullet) + 1))
-    if compressed:
-        for i in items:
-            text = innersep.join(i.splitlines())
-            s += "%s %s\n" % (bullet, text)
-    else:
-        for i in items:
-            text = innersep.join(i.splitlines())
-            s += "\n%s %s\n" % (bullet, text)
-    return s
+    tpl = "%s %s\n" if compressed else "\n%s %s\n"
+    return ''.join([
+        tpl % (bullet, innersep.join(i.splitlines())) for i in items])
 
 
 def ol(items, bullet="#."):
@@ -237,22 +286,14 @@ def boldheader(title):
 
 #
 def toctree(*children, **options):
-    text = "\n\n.. toctree::"
-    for k, v in options.items():
-        text += "\n    "
-        text += ":{0}:".format(k)
-        if isinstance(v, str):
-            text += " " + v
-        elif v is True:
-            pass
-        else:
-            text += " " + str(v)
-
-    text += "\n"
-    for child in children:
-        text += "\n    " + child
-    text += "\n"
-    return str(text)
+    parts = ["\n\n.. toctree::"]
+    parts += [
+        f"\n    :{k}:" + ("" if v is True else f" {v}")
+        for k, v in options.items()]
+    parts.append("\n")
+    parts += [f"\n    {child}" for child in children]
+    parts.append("\n")
+    return ''.join(parts)
 
 
 class stdout_prefix(object):
@@ -265,8 +306,15 @@ class stdout_prefix(object):
         sys.stdout = self
 
     def write(self, s):
-        s = self.prefix + self.prefix.join(s.splitlines())
-        self.saved_stdout.write(s)
+        # str.replace is a single C-level pass while splitlines+join
+        # built an intermediate list per write call.  splitlines also
+        # broke on \r and \r\n, so normalize those to \n first; a
+        # single trailing newline is dropped, as splitlines did.
+        if '\r' in s:
+            s = s.replace('\r\n', '\n').replace('\r', '\n')
+        if s.endswith('\n'):
+            s = s[:-1]
+        self.saved_stdout.write(self.prefix + s.replace('\n', self.prefix))
 
     def __exit__(self, type, value, traceback):
         sys.stdout = self.saved_stdout
@@ -25,8 +25,11 @@ import sys
 import os
 
 from pathlib import Path
-from pkg_resources import parse_version
-import sphinx
+
+# Compiled conf file code objects, keyed on (filename, mtime).  Sphinx
+# rebuilds call configure() again with the same files; re-executing a
+# cached code object is cheap, re-compiling the source is not.
+_conf_cache = {}
 
 def configure(globals_dict, project=None, conffiles=["default_conf.py"]):
     """
@@ -81,6 +84,15 @@ def configure(globals_dict, project=None, conffiles=["default_conf.py"]):
         'rstgen.sphinxconf.insert_input',
     ]
 
+    # Imported here and not at module level because sphinx (and even
+    # more so pkg_resources) are slow to import, and submodules like
+    # base or dirtables don't need them.
+    import sphinx
+    try:
+        from packaging.version import parse as parse_version
+    except ImportError:
+        from pkg_resources import parse_version
+
     # default config for autosummary:
     globals_dict.update(autosummary_generate=True)
     if parse_version(sphinx.__version__) < parse_version("1.8"):
@@ -110,8 +122,13 @@ def configure(globals_dict, project=None, conffiles=["default_conf.py"]):
     for fn in conffiles:
         if not os.path.sep in fn:
             fn = mydir / fn
-        with open(fn, "rb") as fd:
-            exec(compile(fd.read(), fn, 'exec'), globals_dict)
+        key = (str(fn), os.stat(fn).st_mtime)
+        code = _conf_cache.get(key)
+        if code is None:
+            with open(fn, "rb") as fd:
+                code = compile(fd.read(), fn, 'exec')
+            _conf_cache[key] = code
+        exec(code, globals_dict)
 
 def version2rst(self, m):
     """
@@ -40,7 +40,7 @@ from sphinx import addnodes
 from sphinx.util.docutils import SphinxRole
 
 from importlib import import_module
-from rstgen.utils import i2d, srcref, import_from_dotted_path, py2url_txt
+from rstgen.utils import i2d, srcref, py2url_txt
 import atelier
 
 # from docutils.languages import LanguageImporter as li
@@ -36,8 +36,12 @@ Thanks to
 """
 
 import os
+import re
 import calendar
 import datetime
+import heapq
+from functools import lru_cache
+from operator import attrgetter, itemgetter
 
 from sphinx.directives.other import Author
 
@@ -50,6 +54,7 @@ from .insert_input import InsertInputDirective
 from rstgen import toctree
 
 
+@lru_cache(maxsize=None)
 def monthname(n, language):
     """
     Return the monthname for month # n in specified language.
@@ -83,6 +88,15 @@ JINJA_ENV = jinja2.Environment(
     #~ extensions=['jinja2.ext.i18n'],
     loader=jinja2.DictLoader(templates))
 
+# Compiled once at import time; every blogger_year directive renders
+# the same template.
+CALENDAR_TPL = JINJA_ENV.get_template('calendar.rst')
+
+
+# A blog entry docname starts with a two-digit month and a two-digit
+# day, e.g. "0107" or "0108b".
+_DOCNAME_RE = re.compile(r'^(\d{2})(\d{2})')
+
 
 class BloggerDay(object):
     def __init__(self, *args, **kwargs):
@@ -119,39 +133,39 @@ class BloggerYear(object):
         top = os.path.dirname(env.doc2path(env.docname))
         #~ print top
         # print("20211021", year, top, getattr(env, 'blog_instances', None))
-        for (dirpath, dirnames, filenames) in os.walk(top):
-            del dirnames[:]  # don't descend another level
-            #~ unused, year = dirpath.rsplit(os.path.sep,2)
-            #~ year = int(year)
-            #~ assert year in self.years
-            currentday = None
-            docnames = sorted([fn[:-4] for fn in filenames if fn.endswith('.rst')])
-            for docname in sorted(docnames):
-                if docname == "index":
-                    continue
-                d = self.docname_to_day(docname, currentday)
-                if d is not None:
-                    dates_item = self.dates.get(d.date, None)
-                    if dates_item is None:
-                        self.dates[d.date] = d
-                    # self.dates.add(d.date)
-                    currentday = d
+        # scandir instead of os.walk: we only want the files of this one
+        # directory, and with follow_symlinks=False DirEntry.is_file()
+        # answers from the cached d_type without any extra syscall.
+        with os.scandir(top) as it:
+            docnames = sorted(
+                e.name[:-4] for e in it
+                if e.name.endswith('.rst') and e.is_file(follow_symlinks=False))
+        currentday = None
+        for docname in docnames:
+            if docname == "index":
+                continue
+            d = self.docname_to_day(docname, currentday)
+            if d is not None:
+                dates_item = self.dates.get(d.date, None)
+                if dates_item is None:
+                    self.dates[d.date] = d
+                # self.dates.add(d.date)
+                currentday = d
 
         #~ self.years = sorted(self.years)
         if not hasattr(env, 'blog_instances'):
             env.blog_instances = dict()
         years = env.blog_instances.setdefault(blogname, dict())
         years[self.year] = self
+        years['__sorted__'] = None  # invalidate get_blogger_years cache
         # print("20211021b", year, top, env.blog_instances)
 
     def docname_to_day(self, s, currentday):
-        if len(s) < 4:
-            return None
-        try:
-            month = int(s[:2])
-            day = int(s[2:4])
-        except ValueError:
+        m = _DOCNAME_RE.match(s)
+        if m is None:
             return None
+        month = int(m.group(1))
+        day = int(m.group(2))
         if currentday is None or currentday.date.month != month \
             or currentday.date.day != day:
                 currentday = BloggerDay(self.year, month, day)
@@ -162,7 +176,7 @@ class BloggerYear(object):
 
 def year2docname(y):
     assert isinstance(y, BloggerYear)
-    return "/" + y.blogname + "/" + str(y.year) + "/index"
+    return f"/{y.blogname}/{y.year}/index"
 
 
 def navigator(years, current):
@@ -175,28 +189,25 @@ def navigator(years, current):
         if y == current:
             chunks.append(str(y.year))
         else:
-            chunks.append(
-                ":doc:`{0} <{1}>`".format(y.year, year2docname(y)))
+            chunks.append(f":doc:`{y.year} <{year2docname(y)}>`")
     old = ' '.join(chunks)
     return "\n\n{0}\n\n".format(old)
 
 
-def get_all_entries(env):
-
+def _iter_all_entries(env):
+    # Yield one (date, blogname, year, docname) tuple per blog entry.
     blog_instances = getattr(env, 'blog_instances', dict())
-    entries = []
     for blogname, blog in blog_instances.items():
-        for year in blog.values():
+        for k, year in blog.items():
+            if k == '__sorted__':
+                continue
             for day in year.days:
                 for docname in day.docnames:
-                    entries.append((day.date, blogname, year.year, docname))
+                    yield (day.date, blogname, year.year, docname)
 
-    #     years.sort(key=lambda f: f.year)
-    #
-    # years = get_blogger_years(env, blogname)
-    # years = reversed(years, key=lambda f: f.year)
-    entries.sort(key=lambda e: e[0])
-    return reversed(entries)
+
+def get_all_entries(env):
+    return sorted(_iter_all_entries(env), key=itemgetter(0), reverse=True)
 
 
 def get_blogger_years(env, blogname):
@@ -204,8 +215,14 @@ def get_blogger_years(env, blogname):
     blog = blog_instances.get(blogname)
     if blog is None:
         return []
-    years = list(blog.values())
-    years.sort(key=lambda f: f.year)
+    # The sorted tuple is cached in the blog dict itself under a
+    # sentinel key; BloggerYear.__init__ resets it when a year is
+    # added.
+    years = blog.get('__sorted__')
+    if years is None:
+        years = blog['__sorted__'] = tuple(sorted(
+            (v for k, v in blog.items() if k != '__sorted__'),
+            key=attrgetter('year')))
     # print(20220109, [y.year for y in years])
     return years
 
@@ -252,45 +269,50 @@ class YearBlogIndexDirective(InsertInputDirective):
 
         blogger_year = BloggerYear(env)
         years = get_blogger_years(env, blogger_year.blogname)
-        tpl = JINJA_ENV.get_template('calendar.rst')
+        tpl = CALENDAR_TPL
 
         intro = navigator(years, blogger_year)
         intro += '\n'.join(self.content)
 
-        text = ''
+        # The calendar text is accumulated in a list and joined once:
+        # repeated += on a growing string would be quadratic over the
+        # ~12 months x ~35 days fragments.
+        parts = []
         cal = calendar.Calendar()
         num_entries = 0
-        for month in range(1, 13):
-
-            text += """
-
-.. |M%02d| replace::  **%s**""" % (month, monthname(month, self.language))
-
-            weeknum = None
-            #~ text += "\n  |br| Mo Tu We Th Fr Sa Su "
-            for day in cal.itermonthdates(blogger_year.year, month):
-                iso_year, iso_week, iso_day = day.isocalendar()
-                if iso_week != weeknum:
-                    text += "\n  |br|"
-                    weeknum = iso_week
-                if day.month == month:
-                    label = "%02d" % day.day
-                    # docname = "%02d%02d" % (day.month, day.day)
-                    # if blogger_year.year == iso_year and day in blogger_year.days:
-                    blogday = blogger_year.dates.get(day, None)
-                    if blogday is not None:
-                        docname = blogday.docnames[0]
-                        text += " :doc:`%s <%s>` " % (label, docname)
-                        num_entries += 1
-                    elif day > today:
-                        text += ' |sp| '
+        # One yeardatescalendar() call gives all twelve month grids,
+        # already chopped into weeks, instead of twelve itermonthdates
+        # generators plus an isocalendar() call per day to detect the
+        # week boundaries.
+        months = [m for row in cal.yeardatescalendar(blogger_year.year, 1)
+                  for m in row]
+        for month, weeks in enumerate(months, start=1):
+
+            parts.append(f"""
+
+.. |M{month:02d}| replace::  **{monthname(month, self.language)}**""")
+
+            #~ parts.append("\n  |br| Mo Tu We Th Fr Sa Su ")
+            for week in weeks:
+                parts.append("\n  |br|")
+                for day in week:
+                    if day.month == month:
+                        label = f"{day.day:02d}"
+                        # docname = "%02d%02d" % (day.month, day.day)
+                        blogday = blogger_year.dates.get(day, None)
+                        if blogday is not None:
+                            docname = blogday.docnames[0]
+                            parts.append(f" :doc:`{label} <{docname}>` ")
+                            num_entries += 1
+                        elif day > today:
+                            parts.append(' |sp| ')
+                        else:
+                            parts.append(' ' + label + ' ')
                     else:
-                        text += ' ' + label + ' '
-                else:
-                    text += ' |sp| '
+                        parts.append(' |sp| ')
 
         if num_entries > 8:
-            text += """
+            parts.append("""
 
 ===== ===== =====
 |M01| |M02| |M03|
@@ -299,34 +321,31 @@ class YearBlogIndexDirective(InsertInputDirective):
 |M10| |M11| |M12|
 ===== ===== =====
 
-.. rubric:: {0}""".format("All entries:")
-
-        text += "\n\n"
+.. rubric:: {0}""".format("All entries:"))
 
-        days = blogger_year.days
-        if False:
-            days = reversed(days)
+        parts.append("\n\n")
 
-        for day in days:
+        # One pass over the days produces both the entry list and the
+        # hidden toctree.
+        toctree_parts = []
+        for day in blogger_year.days:
             date_text = format_date(day.date, format="long", locale=self.language).strip()
-            text += ("\n\n**{}** --- ".format(date_text))
-            text += ", ".join([":doc:`{}`".format(docname) for docname in day.docnames])
+            parts.append(f"\n\n**{date_text}** --- ")
+            parts.append(", ".join([f":doc:`{docname}`" for docname in day.docnames]))
+            for docname in day.docnames:
+                toctree_parts.append("\n    " + docname)
 
-        text += """
+        parts.append("""
 
 .. toctree::
     :hidden:
 
-"""
+""")
 
-        for day in blogger_year.days:
-            for docname in day.docnames:
-                text += ("\n    " + docname)
-    #         text += """
-    # %02d%02d""" % (day.month, day.day)
+        parts.extend(toctree_parts)
 
         retval = tpl.render(
-            calendar=text,
+            calendar=''.join(parts),
             intro=intro,
             year=blogger_year.year)
             # days=blogger_year.days)
@@ -354,10 +373,12 @@ class LatestEntriesDirective(InsertInputDirective):
         text = ''
         # text += '\n'.join(self.content)
         max_count = 10
-        for i, e in enumerate(get_all_entries(env)):
+        # nlargest is O(N log k): no need to sort all entries to show
+        # the latest few.
+        latest = heapq.nlargest(
+            max_count + 1, _iter_all_entries(env), key=itemgetter(0))
+        for e in latest:
             text += '- {0} :doc:`{1}/{2}/{3}`\n'.format(*e)
-            if i == max_count:
-                break
         if len(text) == 0:
             text += "\n\nNo blog entries found.\n"
         return text
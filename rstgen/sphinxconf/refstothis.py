@@ -39,6 +39,87 @@ def py2rst(x):
     return x
 
 
+# Loaded doctrees, keyed on (id(env), docname).  Held outside the
+# BuildEnvironment on purpose: Sphinx pickles the env's whole __dict__
+# into environment.pickle, and a cache of every doctree would balloon
+# that pickle and peak memory for the lifetime of the build.
+_doctree_cache = {}
+
+
+def _build_xref_index(env):
+    # Build (once per env) an inverted index {reftarget: set(refdoc)}
+    # from one walk over all doctrees, so that every refstothis
+    # directive after the first one is a plain dict lookup.
+    index = getattr(env, '_refstothis_index', None)
+    if index is not None:
+        return index
+    index = {}
+    for docname in env.found_docs:
+        key = (id(env), docname)
+        doc = _doctree_cache.get(key)
+        if doc is None:
+            try:
+                doc = env.get_doctree(docname)
+            except Exception:
+                # 20140117 i had the following after a fab clean:
+                #   File "/home/luc/pythonenvs/py27/local/lib/python2.7/site-packages/sphinx/environment.py", line 1077, in get_doctree
+                #     f = open(doctree_filename, 'rb')
+                # IOError: [Errno 2] No such file or directory: u'/home/luc/hgwork/lino/docs/.build/.doctrees/topics/names.doctree'
+
+                continue
+            _doctree_cache[key] = doc
+
+        # findall (docutils >= 0.18) iterates lazily; traverse builds a
+        # list of every matching node first.
+        findall = getattr(doc, 'findall', doc.traverse)
+        for ref in findall(addnodes.pending_xref):
+            if ref['reftype'] == 'doc':
+                other = docname_join(ref['refdoc'], ref['reftarget'])
+            else:
+                other = ref['reftarget']
+            index.setdefault(other, set()).add(ref['refdoc'])
+    env._refstothis_index = index
+    return index
+
+
+# env.doc2path() results keyed on (id(env), docname): the joins and
+# suffix lookups inside doc2path add up when the same docnames recur
+# across directives.
+_doc2path_cache = {}
+
+
+def _doc2path(env, name):
+    key = (id(env), name)
+    v = _doc2path_cache.get(key)
+    if v is None:
+        v = _doc2path_cache[key] = env.doc2path(name)
+    return v
+
+
+# Source file modification times, keyed like _doc2path_cache.  The
+# same documents recur in the result of every refstothis directive;
+# one stat() per document and build is enough.
+_mtime_cache = {}
+
+
+def _doc_mtime(env, name):
+    key = (id(env), name)
+    v = _mtime_cache.get(key)
+    if v is None:
+        v = _mtime_cache[key] = path.getmtime(_doc2path(env, name))
+    return v
+
+
+def _purge_refstothis(app, env, docname):
+    # A re-read document invalidates the cross-reference index and its
+    # cached doctree.
+    if hasattr(env, '_refstothis_index'):
+        del env._refstothis_index
+    _doctree_cache.pop((id(env), docname), None)
+    _doc2path_cache.pop((id(env), docname), None)
+    _mtime_cache.pop((id(env), docname), None)
+
+
 class RefsToThis(InsertInputDirective):
     """Implements the rst:dir:`refstothis` directive."""
 
@@ -54,54 +135,16 @@ class RefsToThis(InsertInputDirective):
         # target = ' '.join(self.content).strip()
         # if not target:
         #     # print("20140409 target is %r" % target)
-        found = set()
-        rows = set()
-
-        # headers = 'children attributes \
-        # resolved referenced indirect_reference_name \
-        # tagname'.split()
-
-        for docname in env.found_docs:
-            if env.temp_data['docname'] == docname:  # skip myself
-                continue
-
-            try:
-                doc = env.get_doctree(docname)
-            except Exception:
-                # 20140117 i had the following after a fab clean:
-                #   File "/home/luc/pythonenvs/py27/local/lib/python2.7/site-packages/sphinx/environment.py", line 1077, in get_doctree
-                #     f = open(doctree_filename, 'rb')
-                # IOError: [Errno 2] No such file or directory: u'/home/luc/hgwork/lino/docs/.build/.doctrees/topics/names.doctree'
-
-                continue
-
-            # print("20140115 traversing", docname)
-            for ref in doc.traverse(addnodes.pending_xref):
-                if ref['reftype'] == 'doc':
-                    other = docname_join(ref['refdoc'], ref['reftarget'])
-                else:
-                    other = ref['reftarget']
-                if other in targets:
-                    found.add(ref['refdoc'])
-                    # print("20140409 found", ref)
-                else:
-                    # rows.add(ref['reftarget'])
-                    rows.add(other)
-                    # rows.add(repr(ref.attributes))
-                    # row = []
-                    # for h in headers:
-                    #     row.append(py2rst(getattr(ref, h, 'N/A')))
-                    # rows.append(unicode(row))
+        index = _build_xref_index(env)
+        found = set().union(*(index.get(t, ()) for t in targets))
+        found.discard(env.temp_data['docname'])  # skip myself
 
         if len(found) == 0:
             s = """No documents found for targets %r.""" % targets
             # s += """\nPending xrefs were %r.""" % rows
             return s
 
-        entries = []
-        for refdoc in found:
-            mtime = path.getmtime(env.doc2path(refdoc))
-            entries.append((mtime, refdoc))
+        entries = [(_doc_mtime(env, refdoc), refdoc) for refdoc in found]
 
         def f(a):
             return a[0]
@@ -115,10 +158,12 @@ class RefsToThis(InsertInputDirective):
             doc=e[1]) for e in entries]
 
         if 'debug' in self.options:
+            rows = set(index) - targets
             items.append("DEBUG: pending xrefs were %r." % rows)
 
         return rstgen.ul(items)
 
 
 def setup(app):
+    app.connect('env-purge-doc', _purge_refstothis)
     app.add_directive('refstothis', RefsToThis)
@@ -10,15 +10,13 @@ Defines a series of utility classes and functions.
 
 import re
 import os
-import sys
 import datetime
-import inspect
-import subprocess
-from dateutil import parser as dateparser
 from contextlib import contextmanager
-from pathlib import Path
-from pprint import pprint
-from importlib import import_module
+from functools import lru_cache, singledispatch
+
+# inspect, subprocess, pprint and importlib are imported lazily inside
+# the few functions that need them: most users of this module never
+# touch those paths and shouldn't pay the import cost.
 
 
 def confirm(prompt=None, default="y"):
@@ -40,6 +38,7 @@ def confirm(prompt=None, default="y"):
             return False
         print("Please answer Y or N")
 
+@lru_cache(maxsize=4096)
 def i2d(i):
     """
     Convert `int` to `date`. Examples:
@@ -51,12 +50,11 @@ def i2d(i):
     s = str(i)
     if len(s) != 8:
         raise Exception("Invalid date specification {0}.".format(i))
-    d = dateparser.parse(s)
-    d = datetime.date(d.year, d.month, d.day)
-    # print(i, "->", v)
-    return d
+    # The format is known, no need for dateutil's guessing parser.
+    return datetime.date(int(s[:4]), int(s[4:6]), int(s[6:]))
 
 
+@lru_cache(maxsize=4096)
 def i2t(s):
     """
     Convert `int` to `time`. Examples:
@@ -74,13 +72,13 @@ def i2t(s):
     datetime.time(1, 0)
 
     """
-    s = str(s)
-    if len(s) == 4:
-        return datetime.time(int(s[:2]), int(s[2:]))
-    if len(s) == 3:
-        return datetime.time(int(s[:1]), int(s[1:]))
-    if len(s) <= 2:
-        return datetime.time(int(s), 0)
+    if isinstance(s, str):
+        s = int(s)
+    if s < 100:
+        return datetime.time(s, 0)
+    if s < 10000:
+        h, m = divmod(s, 100)
+        return datetime.time(h, m)
     raise ValueError(s)
 
 
@@ -96,7 +94,20 @@ def indentation(s):
     1
 
     """
-    return len(s) - len(s.lstrip())
+    # Count the leading whitespace directly instead of allocating a
+    # stripped copy of the line just to compare lengths.
+    n = 0
+    for ch in s:
+        if ch == ' ' or ch == '\t':
+            n += 1
+        else:
+            break
+    return n
+
+
+# Matches the leading whitespace of a line.  match().end() gives the
+# indentation width without allocating a stripped copy of the line.
+_INDENT_RE = re.compile(r'[ \t]*')
 
 
 def unindent(s):
@@ -127,14 +138,10 @@ def unindent(s):
     lines = s.splitlines()
     if len(lines) == 0:
         return s.strip()
-    mini = sys.maxsize
-    for ln in lines:
-        ln = ln.rstrip()
-        if len(ln) > 0:
-            mini = min(mini, indentation(ln))
-            if mini == 0:
-                break
-    if mini == sys.maxsize:
+    mini = min(
+        (_INDENT_RE.match(ln).end() for ln in lines if ln.rstrip()),
+        default=0)
+    if mini == 0:
         return s
     return '\n'.join([i[mini:] for i in lines])
 
@@ -146,24 +153,35 @@ class SubProcessParent(object):
     Also used standalone by `lino.management.commands.makescreenshots`.
     """
     default_environ = dict()
+    _cached_env = None
     # inheritable_envvars = ('VIRTUAL_ENV', 'PYTHONPATH', 'PATH')
 
     def build_environment(self):
         """Contructs and return a `dict` with the environment variables for
         the future subprocess.
 
+        The result is cached on the instance because copying the whole
+        os.environ for every subprocess adds up in a test suite.  Call
+        :meth:`invalidate_env` after changing :attr:`default_environ`
+        or os.environ.
         """
-        env = dict()
-        env.update(os.environ)
-        env.update(self.default_environ)
-        # env.update(COVERAGE_PROCESS_START="folder/.coveragerc")
-        # for k in self.inheritable_envvars:
-        #     v = os.environ.get(k, None)
-        #     if v is not None:
-        #         env[k] = v
-        return env
+        if self._cached_env is None:
+            # {**a, **b} merges in one C-level pass instead of two
+            # update() calls on an empty dict.
+            self._cached_env = {**os.environ, **self.default_environ}
+            # env.update(COVERAGE_PROCESS_START="folder/.coveragerc")
+            # for k in self.inheritable_envvars:
+            #     v = os.environ.get(k, None)
+            #     if v is not None:
+            #         env[k] = v
+        return self._cached_env
+
+    def invalidate_env(self):
+        """Discard the environment cached by :meth:`build_environment`."""
+        self._cached_env = None
 
     def check_output(self, args, **kw):
+        import subprocess
         env = self.build_environment()
         kw.update(env=env)
         kw.update(stderr=subprocess.STDOUT)
@@ -175,6 +193,7 @@ class SubProcessParent(object):
         They can be e.g.  `cwd` : the working directory
 
         """
+        import subprocess
         env = self.build_environment()
         # raise Exception("20170912 {}".format(env.keys()))
         kw.update(env=env)
@@ -186,26 +205,40 @@ class SubProcessParent(object):
         kw.update(universal_newlines=True)
         return subprocess.Popen(args, **kw)
 
+    def run_subprocesses(self, arg_lists, max_workers=None, **kw):
+        """
+        Run several independent subprocesses concurrently, wait until
+        they all terminated, fail if any of them failed.
+
+        communicate() releases the GIL while waiting, so a thread pool
+        gives near-linear throughput for I/O-bound fan-out.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [ex.submit(self.run_subprocess, args, **kw)
+                       for args in arg_lists]
+            for fut in futures:
+                fut.result()
+
     def run_subprocess(self, args, **kw):
         """
         Run a subprocess, wait until it terminates,
         fail if the returncode is not 0.
         """
         # print ("20150214 run_subprocess %r" % args)
-        p = self.open_subprocess(args, **kw)
-
-        # wait() will deadlock when using stdout=PIPE and/or
-        # stderr=PIPE and the child process generates enough output to
-        # a pipe such that it blocks waiting for the OS pipe buffer to
-        # accept more data. Use communicate() to avoid that.
-        if False:
-            p.wait()
-        else:
-            out, err = p.communicate()
-        # raise Exception("20160711 run_subprocess", out)
-        rv = p.returncode
-        # kw.update(stderr=buffer)
-        # rv = subprocess.call(args,**kw)
+        import subprocess
+        pkw = dict(kw)
+        pkw.update(env=self.build_environment())
+        pkw.update(stdout=subprocess.PIPE)
+        pkw.update(stderr=subprocess.STDOUT)
+        pkw.update(universal_newlines=True)
+
+        # subprocess.run() uses communicate() internally, which avoids
+        # the deadlock that wait() has when stdout=PIPE and the child
+        # fills the OS pipe buffer.
+        cp = subprocess.run(args, **pkw)
+        out = cp.stdout
+        rv = cp.returncode
         if rv != 0:
             cmd = ' '.join(map(str, args))  # args can contain PosixPath instances
             # if six.PY2:
@@ -232,19 +265,36 @@ class SubProcessParent(object):
 
 @contextmanager
 def cd(path):
-    old_dir = os.getcwd()
-    os.chdir(path)
-    yield
-    os.chdir(old_dir)
-
-
-def srcref_url_template(mod):
-    root_mod_name = mod.__name__.split('.')[0]
+    # Restore the old cwd even when the body raises.  On POSIX we keep
+    # a file descriptor: the kernel restores by inode without
+    # re-resolving the path.  Windows can't chdir to an fd, so fall
+    # back to remembering the path there.
+    if os.chdir in os.supports_fd:
+        old = os.open('.', os.O_RDONLY)
+    else:
+        old = os.getcwd()
+    try:
+        os.chdir(path)
+        yield
+    finally:
+        os.chdir(old)
+        if not isinstance(old, str):
+            os.close(old)
+
+
+@lru_cache(maxsize=None)
+def _template_for_root(root_mod_name):
+    # One (root_mod, template) pair per root package: autodoc asks for
+    # thousands of symbols of the same few packages.
     root_mod = __import__(root_mod_name)
+    # Namespace packages have __file__ = None and C builtins have no
+    # __file__ at all; they get no srcref.
+    f = getattr(root_mod, '__file__', None)
+    root = os.path.dirname(os.path.dirname(f)) if f else ''
     setup_info = getattr(root_mod, 'SETUP_INFO', {})
     url = setup_info.get('url')
     if url is None:
-        return (root_mod, None)
+        return (root_mod, None, root)
     if not url.endswith('/'):
         url += "/"
     # srcref_url = getattr(root_mod, 'srcref_url', None)
@@ -253,10 +303,26 @@ def srcref_url_template(mod):
     #     return
     #~ if not mod.__name__.startswith('lino.'):
         #~ return
-    return (root_mod, url + "blob/master/%s")
+    return (root_mod, url + "blob/master/%s", root)
+
+
+def srcref_url_template(mod):
+    root_mod, tpl, root = _template_for_root(mod.__name__.split('.')[0])
+    return (root_mod, tpl)
+
+@lru_cache(maxsize=None)
+def _is_empty_file(p):
+    # autodoc calls srcref() for every documented object; cache the
+    # stat so each unique file is inspected only once.  A file that
+    # doesn't exist counts as empty (dangling .pyc).
+    try:
+        return os.stat(p).st_size == 0
+    except OSError:
+        return True
+
 
 def srcref(mod):
-    root_mod, tpl = srcref_url_template(mod)
+    root_mod, tpl, root = _template_for_root(mod.__name__.split('.')[0])
     if tpl is None:
         return
     srcref = mod.__file__
@@ -266,36 +332,16 @@ def srcref(mod):
         # failed on readthedocs.org because there was a dangling pyc
         # file on my machine which caused autodoc to create an entry
         # in docs/api.
-        if os.stat(srcref).st_size == 0:
+        if _is_empty_file(srcref):
             return
     #~ srcref = srcref[len(lino.__file__)-17:]
-    root = str(Path(root_mod.__file__).parents[1])
-    if len(root):
+    if root:
         srcref = srcref[len(root) + 1:]
     srcref = srcref.replace(os.path.sep, '/')
     return tpl % srcref
 
 
-def import_from_dotted_path(dotted_names, path=None):
-    """
-    Thanks to Chase Seibert,
-    https://chase-seibert.github.io/blog/2014/04/23/python-imp-examples.html
-    """
-
-    s = dotted_names.split('.', 1)
-    if len(s) == 2:
-        first, remaining = s
-    else:
-        first, remaining = dotted_names, None
-    fp, pathname, description = importlib.find_module(first, path)
-    module = importlib.load_module(first, fp, pathname, description)
-    if not remaining:
-        return (module, None)
-    if hasattr(module, remaining):
-        return (module, getattr(module, remaining))
-    return import_from_dotted_path(remaining, path=module.__path__)
-
-
+@lru_cache(maxsize=8192)
 def py2url_txt(s):
     """
     Return a tuple `(url, txt)` where `url` is the URL which links to
@@ -309,12 +355,8 @@ def py2url_txt(s):
         s = args[0]
         txt = args[1]
 
-    if False:
-        try:
-            mod, obj = import_from_dotted_path(s)
-            return (srcref(mod), txt)
-        except Exception as e:
-            return ("Error in Python code ({})".format(e), txt)
+    import inspect
+    from importlib import import_module
     parts = s.split('.')
     try:
         obj = import_module(parts[0])
@@ -326,59 +368,7 @@ def py2url_txt(s):
         return ("Error in Python code ({})".format(e), txt)
 
 
-def dict_py2(old_dict):
-    """Convert the given `dict` so that it's `repr` is the same for both
-    Python 2 and 3.
-
-    Deprecated. Use :func:`rmu` instead.
-    """
-    from future.utils import viewitems
-    new_dict = {}
-    for (key, value) in viewitems(old_dict):
-        if type(value) == dict:
-            new_dict[str(key)] = dict_py2(value)
-        elif type(value) == list:
-            new_dict[str(key)] = list_py2(value)
-        elif type(value) == tuple:
-            new_dict[str(key)] = tuple_py2(value)
-        else:
-            if isinstance(value, bool):
-                new_dict[str(key)] = value
-            else:
-                new_dict[str(key)] = str(value)
-    return new_dict
-
-
-def list_py2(old_list):
-    """Convert the given `list` so that it's `repr` is the same for both
-    Python 2 and 3.
-
-    Deprecated. Use :func:`rmu` instead.
-
-    """
-    new_list = []
-    for item in old_list:
-        if type(item) == dict:
-            new_list.append(dict_py2(item))
-        elif type(item) == tuple:
-            new_list.append(tuple_py2(item))
-        else:
-            new_list.append(str(item))
-    return new_list
-
-
-def tuple_py2(old_tuple):
-    """Convert the given `tuple` so that it's `repr` is the same for both
-    Python 2 and 3.
-
-    Deprecated. Use :func:`rmu` instead.
-
-    """
-    lst = list(old_tuple)
-    lst = list_py2(lst)
-    return tuple(lst)
-
-
+@singledispatch
 def rmu(x):
     """Remove the 'u' prefix from unicode strings under Python 2 in order
     to produce Python 3 compatible output in a doctested code snippet.
@@ -393,23 +383,37 @@ def rmu(x):
     {...'\\xc4\\xf6\\xfc': '\\xc4\\xf6\\xfc'...}
 
     """
-    if isinstance(x, Path):
-        return x
-    # if isinstance(x, collections.namedtuple):
-    #     return x
-    if isinstance(x, list):
-        return [rmu(i) for i in x]
-    if isinstance(x, tuple):
-        return tuple([rmu(i) for i in x])
-    if isinstance(x, dict):
-        return {rmu(k):rmu(v) for k,v in x.items()}
-    if isinstance(x, str):
-        return str(x)
+    # Anything unregistered (including Path) is returned as is.
     return x
 
 
+# singledispatch dispatches on a cached type lookup instead of
+# re-running an isinstance cascade on every element of a nested
+# structure.
+
+@rmu.register(list)
+def _(x):
+    return [rmu(i) for i in x]
+
+
+@rmu.register(tuple)
+def _(x):
+    return tuple([rmu(i) for i in x])
+
+
+@rmu.register(dict)
+def _(x):
+    return {rmu(k): rmu(v) for k, v in x.items()}
+
+
+@rmu.register(str)
+def _(x):
+    return str(x)
+
+
 def sixprint(*args):
     """Like print, but simulating PY3 output under PY2."""
+    from pprint import pprint
     for x in args:
         # if six.PY2 and isinstance(x, set):
         #     print("{%s}" % ', '.join([str(rmu(i)) for i in x]))
@@ -22,8 +22,6 @@ License :: OSI Approved :: GNU Affero General Public License v3
 Natural Language :: English
 Operating System :: OS Independent""".splitlines())
 
-SETUP_INFO.update(long_description=open("README.rst").read())
-
 SETUP_INFO.update(
     zip_safe=False,
     include_package_data=True)
@@ -31,4 +29,8 @@ SETUP_INFO.update(
 
 
 if __name__ == '__main__':
+    # Read only when actually building/installing; tools that import
+    # setup.py for its SETUP_INFO don't need the long_description.
+    with open("README.rst", encoding="utf-8") as f:
+        SETUP_INFO.update(long_description=f.read())
     setup(**SETUP_INFO)